@@ -1,36 +1,49 @@
 # server.py
 from __future__ import annotations
+import asyncio
+import inspect
 import os
-from typing import Any, Dict, List, Optional, Union
-
-from mcp.server.fastmcp import FastMCP, Context
-from mcp.server.session import ServerSession
-
-import gitlab
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from functools import lru_cache, partial, wraps
+from itertools import islice
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Deque, Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
+
+import anyio
+import anyio.to_thread
+
+if TYPE_CHECKING:
+    import gitlab
 
 # -----------------------------
 # Utilidades de configuración
 # -----------------------------
 
-def _env_bool(name: str, default: str = "false") -> bool:
-    return os.getenv(name, default).strip().lower() in {"1", "true", "yes", "y", "on"}
+_TRUTHY = frozenset({"1", "true", "yes", "y", "on"})
+
+def _env_bool(name: str, default: Optional[str] = None) -> bool:
+    return (os.environ.get(name) or default or "").strip().lower() in _TRUTHY
 
 GITLAB_API_URL = os.getenv("GITLAB_API_URL", "https://gitlab.com")
 GITLAB_TOKEN = os.getenv("GITLAB_PERSONAL_ACCESS_TOKEN")
 DEFAULT_PROJECT_ID = os.getenv("GITLAB_PROJECT_ID")
-ALLOWED_IDS = {s.strip() for s in os.getenv("GITLAB_ALLOWED_PROJECT_IDS", "").split(",") if s.strip()}
-READ_ONLY = _env_bool("GITLAB_READ_ONLY_MODE", "false")
-USE_WIKI = _env_bool("USE_GITLAB_WIKI", "false")
-USE_MILESTONE = _env_bool("USE_MILESTONE", "false")
-USE_PIPELINE = _env_bool("USE_PIPELINE", "false")
+ALLOWED_IDS = frozenset(sys.intern(s) for s in (p.strip() for p in os.getenv("GITLAB_ALLOWED_PROJECT_IDS", "").split(",")) if s)
+READ_ONLY = _env_bool("GITLAB_READ_ONLY_MODE")
+USE_WIKI = _env_bool("USE_GITLAB_WIKI")
+USE_MILESTONE = _env_bool("USE_MILESTONE")
+USE_PIPELINE = _env_bool("USE_PIPELINE")
 AUTH_COOKIE_PATH = os.getenv("GITLAB_AUTH_COOKIE_PATH")
+MAX_RPS = float(os.getenv("GITLAB_MAX_RPS", "10"))
+MAX_CONCURRENCY = int(os.getenv("GITLAB_MAX_CONCURRENCY", "32"))
+CACHE_TTL = float(os.getenv("GITLAB_CACHE_TTL", "60"))
 
 # Transporte (elige por env)
-TRANSPORT = "stdio"
-if _env_bool("STREAMABLE_HTTP"):
-    TRANSPORT = "streamable-http"
-elif _env_bool("SSE"):
-    TRANSPORT = "sse"
+TRANSPORT = next((t for env, t in (("STREAMABLE_HTTP", "streamable-http"), ("SSE", "sse"))
+                  if _env_bool(env)), "stdio")
 
 # -----------------------------
 # Cliente GitLab
@@ -38,58 +51,295 @@ elif _env_bool("SSE"):
 if not GITLAB_TOKEN:
     raise RuntimeError("Falta GITLAB_PERSONAL_ACCESS_TOKEN en el entorno.")
 
-gl = gitlab.Gitlab(GITLAB_API_URL, private_token=GITLAB_TOKEN, api_version=4)
+# Cache de ETags acotada por bytes totales: son listados chicos que se consultan seguido
+_ETAG_MAX_BODY = 64 * 1024
+_ETAG_MAX_BYTES = 8 * 1024 * 1024
 
-# Cookie-based auth opcional
-if AUTH_COOKIE_PATH and os.path.exists(AUTH_COOKIE_PATH):
-    with open(AUTH_COOKIE_PATH, "r", encoding="utf-8") as fh:
-        cookie_value = fh.read().strip()
-        if cookie_value:
-            gl.session.headers["Cookie"] = cookie_value
+class _Throttle:
+    """Token bucket que respeta `RateLimit-*` y `Retry-After` de GitLab.
 
-def _ensure_pid(project_id: Optional[Union[int, str]]) -> Union[int, str]:
-    pid = project_id or DEFAULT_PROJECT_ID
-    if not pid:
-        raise ValueError("'project_id' es requerido (o define GITLAB_PROJECT_ID).")
-    if ALLOWED_IDS and str(pid) not in ALLOWED_IDS:
-        raise PermissionError(f"project_id {pid} no permitido por GITLAB_ALLOWED_PROJECT_IDS")
-    return pid
+    Además revalida los GET con `If-None-Match`: si GitLab responde 304 se reutiliza
+    el cuerpo guardado y no viaja de nuevo. No depende de requests: el HTTPAdapter
+    que lo usa se arma recién al crear el cliente (ver `gl()`).
+    """
 
-def _assert_can_write():
-    if READ_ONLY:
-        raise PermissionError("Servidor en modo solo lectura (GITLAB_READ_ONLY_MODE=true)")
+    def __init__(self, rate: float):
+        self._rate = rate
+        # Capacidad mínima de 1: con rps fraccionario (p.ej. 0.5) el bucket debe poder
+        # llenar al menos un token, o `_acquire` esperaría para siempre.
+        self._capacity = max(1.0, rate)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self._etags: "OrderedDict[str, Tuple[str, bytes, Dict[str, str]]]" = OrderedDict()
+        self._etag_bytes = 0
+
+    def _acquire(self) -> None:
+        if self._rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+    def _observe(self, response: Any) -> None:
+        headers = response.headers
+        retry_after = headers.get("Retry-After", "")
+        reset = headers.get("RateLimit-Reset", "")
+        if response.status_code == 429 and retry_after.isdigit():
+            until = time.monotonic() + int(retry_after)
+        elif headers.get("RateLimit-Remaining") == "0" and reset.isdigit():
+            # RateLimit-Reset es un timestamp Unix
+            until = time.monotonic() + max(0.0, int(reset) - time.time())
+        else:
+            return
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, until)
+
+    def send(self, send: Callable[..., Any], request: Any, *args: Any, **kwargs: Any) -> Any:
+        cacheable = request.method == "GET" and not kwargs.get("stream")
+        cached = None
+        if cacheable:
+            with self._lock:
+                cached = self._etags.get(request.url)
+            if cached is not None:
+                request.headers["If-None-Match"] = cached[0]
+
+        self._acquire()
+        response = send(request, *args, **kwargs)
+        self._observe(response)
+
+        if cached is not None and response.status_code == 304:
+            # Leer el 304 (vacío) devuelve la conexión al pool keep-alive
+            response.content
+            response.status_code = 200
+            response._content = cached[1]
+            response.headers = type(response.headers)(cached[2])
+        elif cacheable and response.status_code == 200 and "ETag" in response.headers:
+            body = response.content
+            if len(body) <= _ETAG_MAX_BODY:
+                with self._lock:
+                    old = self._etags.pop(request.url, None)
+                    if old is not None:
+                        self._etag_bytes -= len(old[1])
+                    self._etags[request.url] = (response.headers["ETag"], body, dict(response.headers))
+                    self._etag_bytes += len(body)
+                    while self._etag_bytes > _ETAG_MAX_BYTES:
+                        self._etag_bytes -= len(self._etags.popitem(last=False)[1][1])
+        return response
+
+_throttle = _Throttle(MAX_RPS)
+
+def _build_client() -> "gitlab.Gitlab":
+    # python-gitlab arrastra requests/urllib3: se importan acá y no al cargar el módulo
+    import gitlab
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    class _RateLimitedAdapter(HTTPAdapter):
+        def send(self, request: Any, *args: Any, **kwargs: Any) -> Any:
+            return _throttle.send(super().send, request, *args, **kwargs)
+
+    client = gitlab.Gitlab(GITLAB_API_URL, private_token=GITLAB_TOKEN, api_version=4)
+
+    # Pool de conexiones keep-alive + reintentos ante errores transitorios. Solo se
+    # reintentan lecturas: un PUT/POST repetido (merge, commit) no es idempotente.
+    # El 429 no va acá (ni `respect_retry_after_header`, que lo reintentaría igual): si
+    # urllib3 lo reintentara por dentro, `_Throttle` no lo vería y el resto de los hilos
+    # seguiría golpeando a GitLab. Lo reintenta python-gitlab (obey_rate_limit) con el
+    # bucket ya bloqueado.
+    adapter = _RateLimitedAdapter(
+        pool_connections=32,
+        pool_maxsize=64,
+        max_retries=Retry(total=5, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                          allowed_methods=frozenset({"GET", "HEAD"}),
+                          respect_retry_after_header=False, raise_on_status=False),
+    )
+    client.session.mount("https://", adapter)
+    client.session.mount("http://", adapter)
+    client.session.headers["Connection"] = "keep-alive"
+
+    # Cookie-based auth opcional (una sola lectura; si el archivo no existe se ignora)
+    try:
+        cookie_value = Path(AUTH_COOKIE_PATH).read_text(encoding="utf-8").strip() if AUTH_COOKIE_PATH else ""
+    except OSError:
+        cookie_value = ""
+    if cookie_value:
+        client.session.headers["Cookie"] = cookie_value
+    return client
+
+_gl: Optional["gitlab.Gitlab"] = None
+_gl_lock = threading.Lock()
+
+def gl() -> "gitlab.Gitlab":
+    """Cliente GitLab compartido; se crea en la primera llamada a una tool."""
+    global _gl
+    if _gl is None:
+        with _gl_lock:
+            if _gl is None:
+                _gl = _build_client()
+    return _gl
+
+def _make_checks(allowed: FrozenSet[str] = ALLOWED_IDS, read_only: bool = READ_ONLY,
+                 default_pid: Optional[str] = DEFAULT_PROJECT_ID):
+    """Arma los chequeos que corre cada tool sobre la config ya resuelta (sin globals)."""
+    # Variante entera para no convertir con str() los ids numéricos en cada llamada. Solo
+    # ids decimales canónicos: "007" no debe habilitar 7 (con str(pid) nunca lo hacía).
+    allowed_int = frozenset(int(x) for x in allowed if x.isdecimal() and str(int(x)) == x)
+
+    @lru_cache(maxsize=256)
+    def _check_pid(pid: Optional[Union[int, str]]) -> Optional[Tuple[type, str]]:
+        # Se cachea el error como (tipo, mensaje) y no la excepción: una instancia
+        # re-lanzada iría acumulando traceback en cada llamada.
+        if not pid:
+            return ValueError, "'project_id' es requerido (o define GITLAB_PROJECT_ID)."
+        if allowed and pid not in (allowed_int if isinstance(pid, int) else allowed):
+            return PermissionError, f"project_id {pid} no permitido por GITLAB_ALLOWED_PROJECT_IDS"
+        return None
+
+    def _ensure_pid(project_id: Optional[Union[int, str]]) -> Union[int, str]:
+        pid = project_id or default_pid
+        err = _check_pid(pid)
+        if err is not None:
+            raise err[0](err[1])
+        return pid
+
+    def _assert_can_write():
+        if read_only:
+            raise PermissionError("Servidor en modo solo lectura (GITLAB_READ_ONLY_MODE=true)")
+
+    return _ensure_pid, _assert_can_write
+
+_ensure_pid, _assert_can_write = _make_checks()
+
+@lru_cache(maxsize=32)
+def _proj(pid: Union[int, str]):
+    # Proyecto "lazy": solo arma las URLs, sin GET /projects/:id. Se cachea por pid
+    # porque construirlo crea todos sus managers y codifica sus rutas base.
+    return gl().projects.get(pid, lazy=True)
+
+# Cache TTL en memoria para lecturas idempotentes (GITLAB_CACHE_TTL=0 lo desactiva).
+# La clave empieza con el nombre de la tool, para invalidar por prefijo.
+_CACHE_MAX_ENTRIES = 1024
+_cache: "OrderedDict[Tuple[Any, ...], Tuple[float, Any]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _cached(key: Tuple[Any, ...], fetch: Callable[[], Any]) -> Any:
+    if CACHE_TTL <= 0:
+        return fetch()
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None and hit[0] > now:
+            _cache.move_to_end(key)
+            return hit[1]
+    value = fetch()
+    with _cache_lock:
+        _cache[key] = (now + CACHE_TTL, value)
+        _cache.move_to_end(key)
+        if len(_cache) > _CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return value
+
+def _cache_invalidate(prefix: str) -> None:
+    with _cache_lock:
+        for key in [k for k in _cache if k[0] == prefix]:
+            del _cache[key]
 
 # -----------------------------
 # Servidor MCP
 # -----------------------------
 
+# Se importa recién aquí: si falta el token no se paga la carga del SDK
+from mcp.server.fastmcp import FastMCP
+
 mcp = FastMCP("GitLab MCP (Python)")
 
+# python-gitlab es bloqueante: cada tool corre en un hilo para no frenar el
+# event loop, con un tope de llamadas simultáneas a GitLab.
+_LIMITER = anyio.CapacityLimiter(MAX_CONCURRENCY)
+
+async def _run(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    return await anyio.to_thread.run_sync(partial(fn, *args, **kwargs), limiter=_LIMITER)
+
+async def _gather_limited(coros: Iterable[Awaitable[Any]], limit: int = 10,
+                          return_exceptions: bool = False) -> List[Any]:
+    """`asyncio.gather` con a lo sumo `limit` corutinas en vuelo (fan-out hacia GitLab)."""
+    sem = asyncio.Semaphore(limit)
+
+    async def run(coro: Awaitable[Any]) -> Any:
+        async with sem:
+            return await coro
+
+    return await asyncio.gather(*(run(c) for c in coros), return_exceptions=return_exceptions)
+
+def _register(fn: Callable[..., Any]) -> None:
+    """Como `mcp.tool()`, pero las funciones síncronas se ejecutan en un hilo."""
+    if inspect.iscoroutinefunction(fn):
+        mcp.tool()(fn)
+        return
+
+    @wraps(fn)
+    async def runner(*args: Any, **kwargs: Any) -> Any:
+        return await _run(fn, *args, **kwargs)
+    mcp.tool()(runner)
+
 # ----------
 # PROJECTS
 # ----------
 
-@mcp.tool()
 def search_repositories(query: str, membership: bool = False, starred: bool = False,
                         visibility: Optional[str] = None, simple: bool = True,
-                        page: int = 1, per_page: int = 20) -> List[Dict[str, Any]]:
-    """Buscar proyectos (repos) en GitLab."""
-    projects = gl.projects.list(search=query, membership=membership, starred=starred,
-                                visibility=visibility, simple=simple, page=page, per_page=per_page)
-    return [
-        {
-            "id": p.id,
-            "name": p.name,
-            "name_with_namespace": getattr(p, "name_with_namespace", p.name),
-            "path_with_namespace": getattr(p, "path_with_namespace", None),
-            "web_url": getattr(p, "web_url", None),
-            "default_branch": getattr(p, "default_branch", None),
-            "last_activity_at": getattr(p, "last_activity_at", None),
-        }
-        for p in projects
-    ]
+                        page: int = 1, per_page: int = 20,
+                        cursor: Optional[str] = None) -> Dict[str, Any]:
+    """Buscar proyectos (repos) en GitLab.
+
+    Resultados ordenados por id. Para seguir, pasa `next_cursor` como `cursor`: filtra
+    con `id_after` en vez de saltar filas con `page`, así las páginas profundas no
+    cuestan más en el servidor. `per_page` se acota a 1..100 (máximo de GitLab).
+    """
+    if len(query.strip()) < 2:
+        raise ValueError("'query' debe tener al menos 2 caracteres.")
+    per_page = max(1, min(int(per_page), 100))
+    page = max(1, int(page))
+
+    def fetch() -> Dict[str, Any]:
+        params: Dict[str, Any] = {"search": query, "membership": membership, "starred": starred,
+                                  "visibility": visibility, "simple": simple, "order_by": "id",
+                                  "sort": "asc", "per_page": per_page}
+        if cursor:
+            params["id_after"] = cursor
+        else:
+            params["page"] = page
+        # Dicts crudos: sin un RESTObject por proyecto
+        projects = gl().http_get("/projects", query_data=params)
+        rows = [
+            {
+                "id": p["id"],
+                "name": p["name"],
+                "name_with_namespace": p.get("name_with_namespace", p["name"]),
+                "path_with_namespace": p.get("path_with_namespace"),
+                "web_url": p.get("web_url"),
+                "default_branch": p.get("default_branch"),
+                "last_activity_at": p.get("last_activity_at"),
+            }
+            for p in projects
+        ]
+        next_cursor = str(rows[-1]["id"]) if len(rows) == per_page else None
+        return {"projects": rows, "next_cursor": next_cursor}
+
+    return _cached(("search_repositories", query, membership, starred, visibility, simple,
+                    page, per_page, cursor), fetch)
 
-@mcp.tool()
 def create_repository(name: str, namespace_id: Optional[int] = None,
                       visibility: str = "private", description: Optional[str] = None) -> Dict[str, Any]:
     """Crear un nuevo proyecto (repo)."""
@@ -99,63 +349,112 @@ def create_repository(name: str, namespace_id: Optional[int] = None,
         data["namespace_id"] = namespace_id
     if description:
         data["description"] = description
-    proj = gl.projects.create(data)
+    proj = gl().projects.create(data)
+    _cache_invalidate("search_repositories")
     return {"id": proj.id, "name": proj.name, "web_url": proj.web_url}
 
 # ----------
 # FILES & COMMITS
 # ----------
 
-@mcp.tool()
-def get_file_contents(ref: str, path: str, project_id: Optional[Union[int, str]] = None,
-                      with_tree: bool = False) -> Dict[str, Any]:
-    """Obtener contenido de archivo o (opcional) listado del árbol."""
+async def get_file_contents(ref: str, path: str, project_id: Optional[Union[int, str]] = None,
+                            with_tree: bool = False, decode_text: bool = True) -> Dict[str, Any]:
+    """Obtener contenido de archivo o (opcional) listado del árbol.
+
+    Archivos de texto se devuelven decodificados (`encoding: "text"`); binarios, o
+    cualquier archivo si `decode_text=False`, en el base64 original de GitLab.
+    """
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
+
+    # Archivo y árbol son independientes: se piden en paralelo. El proyecto se resuelve
+    # dentro del worker: en frío `_proj` crea el cliente (imports, sesión, lock) y eso
+    # no debe correr en el event loop.
+    calls = [_run(lambda: _proj(pid).files.get(file_path=path, ref=ref))]
+    if with_tree:
+        calls.append(_run(lambda: _proj(pid).repository_tree(path=path, ref=ref, recursive=False)))
+    f, *rest = await _gather_limited(calls, return_exceptions=True)
 
     # Si piden árbol
     tree: Optional[List[Dict[str, Any]]] = None
-    if with_tree:
-        tree_objs = project.repository_tree(path=path, ref=ref, recursive=False)
-        tree = [{"type": t["type"], "path": t["path"]} for t in tree_objs]
+    if rest:
+        if isinstance(rest[0], BaseException):
+            raise rest[0]
+        tree = [{"type": t["type"], "path": t["path"]} for t in rest[0]]
 
-    # Intentar leer archivo
-    try:
-        f = project.files.get(file_path=path, ref=ref)
-        # Contenido viene en base64
-        content = f.decode()
-        return {"path": path, "ref": ref, "content": content, "tree": tree}
-    except Exception:
+    if isinstance(f, BaseException):
         # Puede ser carpeta solamente
         if tree is not None:
-            return {"path": path, "ref": ref, "content": None, "tree": tree}
-        raise
+            return {"path": path, "ref": ref, "content": None, "encoding": None, "tree": tree}
+        raise f
+    # Contenido viene en base64: se entrega tal cual salvo que sea texto UTF-8
+    if decode_text and f.encoding == "base64":
+        try:
+            text = f.decode().decode("utf-8")
+            return {"path": path, "ref": ref, "content": text, "encoding": "text", "tree": tree}
+        except UnicodeDecodeError:
+            pass
+    return {"path": path, "ref": ref, "content": f.content, "encoding": f.encoding, "tree": tree}
 
-@mcp.tool()
 def create_or_update_file(branch: str, path: str, content: str, commit_message: str,
-                          project_id: Optional[Union[int, str]] = None) -> Dict[str, Any]:
-    """Crear o actualizar un archivo único en una rama."""
+                          project_id: Optional[Union[int, str]] = None,
+                          batch_id: Optional[str] = None) -> Dict[str, Any]:
+    """Crear o actualizar un archivo único en una rama.
+
+    Con `batch_id` (ver `begin_batch`) el cambio se encola y se publica en `commit_batch`.
+    """
+    from gitlab.exceptions import GitlabCreateError, GitlabHeadError
+
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
-
-    try:
-        f = project.files.get(file_path=path, ref=branch)
-        f.content = content
-        f.save(branch=branch, commit_message=commit_message)
-        action = "updated"
-    except gitlab.exceptions.GitlabGetError:
-        project.files.create({
-            "file_path": path,
+    project = _proj(pid)
+
+    if batch_id:
+        with _BATCHES_LOCK:
+            batch = _BATCHES.get(batch_id)
+        if batch is None:
+            raise ValueError(f"No existe el lote {batch_id}")
+        if str(batch["project_id"]) != str(pid) or batch["branch"] != branch:
+            raise ValueError(f"El lote {batch_id} es para {batch['project_id']}@{batch['branch']}")
+        # Se consulta en cada escritura (fuera del lock: no bloquea al resto de los lotes).
+        # Solo un 404 significa "no existe"; 401/403/5xx se propagan en vez de encolar
+        # un "create" que haría fallar `commit_batch` una y otra vez.
+        try:
+            project.files.head(path, ref=branch)
+            action = "update"
+        except GitlabHeadError as e:
+            if e.response_code != 404:
+                raise
+            action = "create"
+        # Chequeo y escritura en una sola toma del lock: si el lote ya se publicó (o se
+        # está publicando) el cambio no puede quedar en un dict huérfano. Un mismo archivo
+        # solo puede aparecer una vez por commit: se reemplaza su acción y contenido.
+        with _BATCHES_LOCK:
+            if _BATCHES.get(batch_id) is not batch or batch["committing"]:
+                raise ValueError(f"El lote {batch_id} ya fue publicado o se está publicando")
+            batch["actions"][path] = {"action": action, "file_path": path, "content": content}
+            batch["touched"] = time.monotonic()
+        return {"project_id": pid, "branch": branch, "path": path, "action": "queued", "batch_id": batch_id}
+
+    # Un solo POST a la API de commits: se intenta "update" y, solo si el archivo
+    # no existe, se reintenta como "create".
+    def commit(action: str):
+        return project.commits.create({
             "branch": branch,
-            "content": content,
             "commit_message": commit_message,
+            "actions": [{"action": action, "file_path": path, "content": content}],
         })
+
+    try:
+        commit("update")
+        action = "updated"
+    except GitlabCreateError as e:
+        if e.response_code != 400 or "doesn't exist" not in str(e.error_message):
+            raise
+        commit("create")
         action = "created"
 
     return {"project_id": pid, "branch": branch, "path": path, "action": action}
 
-@mcp.tool()
 def push_files(branch: str, files: List[Dict[str, str]], commit_message: str,
                project_id: Optional[Union[int, str]] = None) -> Dict[str, Any]:
     """Push de múltiples archivos en un solo commit.
@@ -166,7 +465,7 @@ def push_files(branch: str, files: List[Dict[str, str]], commit_message: str,
     
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
+    project = _proj(pid)
 
     commit = project.commits.create({
         "branch": branch,
@@ -175,22 +474,83 @@ def push_files(branch: str, files: List[Dict[str, str]], commit_message: str,
     })
     return {"id": commit.id, "short_id": commit.short_id, "title": commit.title}
 
-@mcp.tool()
+# Lotes de escritura: acciones encoladas en memoria hasta `commit_batch`. Un lote
+# sin actividad por `_BATCH_TTL` segundos se descarta al abrir otro.
+_BATCHES: Dict[str, Dict[str, Any]] = {}
+_BATCHES_LOCK = threading.Lock()
+_BATCH_TTL = 3600.0
+_BATCHES_MAX = 256
+
+def _prune_batches(now: float) -> None:
+    # Llamar con _BATCHES_LOCK tomado
+    expired = [k for k, b in _BATCHES.items()
+               if not b["committing"] and now - b["touched"] > _BATCH_TTL]
+    for k in expired:
+        del _BATCHES[k]
+
+def begin_batch(branch: str, project_id: Optional[Union[int, str]] = None) -> Dict[str, Any]:
+    """Abrir un lote de escrituras: `create_or_update_file` con este `batch_id` encola
+    los cambios y `commit_batch` los publica todos en un único commit."""
+    _assert_can_write()
+    pid = _ensure_pid(project_id)
+    batch_id = uuid.uuid4().hex
+    now = time.monotonic()
+    with _BATCHES_LOCK:
+        _prune_batches(now)
+        if len(_BATCHES) >= _BATCHES_MAX:
+            raise ValueError(f"Demasiados lotes abiertos ({_BATCHES_MAX}); publica alguno con commit_batch")
+        _BATCHES[batch_id] = {"project_id": pid, "branch": branch, "actions": {},
+                              "committing": False, "touched": now}
+    return {"batch_id": batch_id, "project_id": pid, "branch": branch}
+
+def commit_batch(batch_id: str, commit_message: str) -> Dict[str, Any]:
+    """Publicar en un solo commit todas las escrituras encoladas en el lote."""
+    _assert_can_write()
+    # Copia de las acciones bajo el lock; mientras se publica, el lote no admite escrituras
+    with _BATCHES_LOCK:
+        batch = _BATCHES.get(batch_id)
+        if batch is None:
+            raise ValueError(f"No existe el lote {batch_id}")
+        if batch["committing"]:
+            raise ValueError(f"El lote {batch_id} ya se está publicando")
+        actions = list(batch["actions"].values())
+        if not actions:
+            del _BATCHES[batch_id]
+            return {"batch_id": batch_id, "id": None, "files": 0}
+        batch["committing"] = True
+    project = _proj(batch["project_id"])
+    # El lote se descarta solo si el commit se creó: ante un error (rama desactualizada,
+    # acción inválida, red) sigue abierto y se puede corregir y reintentar.
+    try:
+        commit = project.commits.create({
+            "branch": batch["branch"],
+            "commit_message": commit_message,
+            "actions": actions,
+        })
+    except BaseException:
+        with _BATCHES_LOCK:
+            batch["committing"] = False
+        raise
+    with _BATCHES_LOCK:
+        _BATCHES.pop(batch_id, None)
+    return {"batch_id": batch_id, "id": commit.id, "short_id": commit.short_id,
+            "files": len(actions)}
+
 def fork_repository(project_id: Optional[Union[int, str]] = None,
                     namespace: Optional[str] = None) -> Dict[str, Any]:
     """Fork del repositorio hacia tu espacio o el `namespace` indicado."""
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
+    project = _proj(pid)
     fork = project.forks.create({"namespace_path": namespace} if namespace else {})
+    _cache_invalidate("search_repositories")
     return {"id": fork.id, "path_with_namespace": fork.path_with_namespace, "web_url": fork.web_url}
 
-@mcp.tool()
 def create_branch(branch: str, ref: str, project_id: Optional[Union[int, str]] = None) -> Dict[str, Any]:
     """Crear una nueva rama (desde `ref`)."""
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
+    project = _proj(pid)
     b = project.branches.create({"branch": branch, "ref": ref})
     return {"name": b.name, "commit": getattr(b, "commit", None)}
 
@@ -198,14 +558,13 @@ def create_branch(branch: str, ref: str, project_id: Optional[Union[int, str]] =
 # ISSUES
 # ----------
 
-@mcp.tool()
 def create_issue(title: str, description: Optional[str] = None, labels: Optional[str] = None,
                  assignee_ids: Optional[List[int]] = None, milestone_id: Optional[int] = None,
                  confidential: bool = False, due_date: Optional[str] = None,
                  project_id: Optional[Union[int, str]] = None) -> Dict[str, Any]:
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
+    project = _proj(pid)
     data: Dict[str, Any] = {"title": title, "confidential": confidential}
     if description:
         data["description"] = description
@@ -220,21 +579,21 @@ def create_issue(title: str, description: Optional[str] = None, labels: Optional
     issue = project.issues.create(data)
     return {"iid": issue.iid, "web_url": issue.web_url}
 
-@mcp.tool()
 def list_issues(project_id: Optional[Union[int, str]] = None, scope: str = "created_by_me",
                state: Optional[str] = None, search: Optional[str] = None,
                labels: Optional[str] = None, page: int = 1, per_page: int = 20) -> List[Dict[str, Any]]:
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
-    issues = project.issues.list(scope=scope, state=state, search=search, labels=labels,
-                                 page=page, per_page=per_page)
-    return [{"iid": i.iid, "title": i.title, "state": i.state, "web_url": i.web_url} for i in issues]
+    project = _proj(pid)
+    # Dicts crudos: se evita construir un RESTObject por issue
+    issues = gl().http_list(project.issues.path,
+                          query_data={"scope": scope, "state": state, "search": search, "labels": labels},
+                          page=page, per_page=per_page, iterator=False)
+    return [{"iid": i["iid"], "title": i["title"], "state": i["state"], "web_url": i["web_url"]} for i in issues]
 
 # ----------
 # MERGE REQUESTS & DIFFS
 # ----------
 
-@mcp.tool()
 def create_merge_request(source_branch: str, target_branch: str, title: str,
                          description: Optional[str] = None, draft: bool = False,
                          remove_source_branch: bool = False, assignee_ids: Optional[List[int]] = None,
@@ -242,11 +601,13 @@ def create_merge_request(source_branch: str, target_branch: str, title: str,
                          project_id: Optional[Union[int, str]] = None) -> Dict[str, Any]:
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
+    project = _proj(pid)
+    # Solo se miran los primeros 6 caracteres, no se copia todo el título
+    needs_draft = draft and title[:6].lower() != "draft:"
     data: Dict[str, Any] = {
         "source_branch": source_branch,
         "target_branch": target_branch,
-        "title": ("Draft: " + title) if draft and not title.lower().startswith("draft:") else title,
+        "title": "Draft: " + title if needs_draft else title,
         "remove_source_branch": remove_source_branch,
     }
     if description:
@@ -259,22 +620,27 @@ def create_merge_request(source_branch: str, target_branch: str, title: str,
     mr = project.mergerequests.create(data)
     return {"iid": mr.iid, "web_url": mr.web_url, "state": mr.state}
 
-def _resolve_mr(project, merge_request_iid: Optional[int], branch_name: Optional[str]):
+def _resolve_mr(project, merge_request_iid: Optional[int], branch_name: Optional[str],
+                lazy: bool = False):
+    """Resolver el MR por iid o rama. `lazy=True` evita el GET cuando solo se usa el iid."""
     if merge_request_iid:
-        return project.mergerequests.get(merge_request_iid)
+        return project.mergerequests.get(merge_request_iid, lazy=lazy)
     if branch_name:
-        mrs = project.mergerequests.list(source_branch=branch_name, state="opened")
+        mrs = project.mergerequests.list(source_branch=branch_name, state="opened",
+                                         per_page=1, get_all=False,
+                                         **({"view": "simple"} if lazy else {}))
         if not mrs:
             raise ValueError(f"No se encontró MR abierto con source_branch={branch_name}")
+        if lazy:
+            return project.mergerequests.get(mrs[0].iid, lazy=True)
         return mrs[0]
     raise ValueError("Provee merge_request_iid o branch_name")
 
-@mcp.tool()
 def get_merge_request(project_id: Optional[Union[int, str]] = None,
                       merge_request_iid: Optional[int] = None,
                       branch_name: Optional[str] = None) -> Dict[str, Any]:
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
+    project = _proj(pid)
     mr = _resolve_mr(project, merge_request_iid, branch_name)
     return {
         "iid": mr.iid,
@@ -285,7 +651,6 @@ def get_merge_request(project_id: Optional[Union[int, str]] = None,
         "web_url": mr.web_url,
     }
 
-@mcp.tool()
 def update_merge_request(project_id: Optional[Union[int, str]] = None,
                          merge_request_iid: Optional[int] = None,
                          branch_name: Optional[str] = None,
@@ -295,8 +660,9 @@ def update_merge_request(project_id: Optional[Union[int, str]] = None,
                          state_event: Optional[str] = None) -> Dict[str, Any]:
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
-    mr = _resolve_mr(project, merge_request_iid, branch_name)
+    project = _proj(pid)
+    mr = _resolve_mr(project, merge_request_iid, branch_name,
+                     lazy=any(v is not None for v in (title, description, labels, state_event)))
 
     if title is not None:
         mr.title = title
@@ -310,7 +676,6 @@ def update_merge_request(project_id: Optional[Union[int, str]] = None,
     mr.save()
     return {"iid": mr.iid, "title": mr.title, "state": mr.state}
 
-@mcp.tool()
 def merge_merge_request(project_id: Optional[Union[int, str]] = None,
                         merge_request_iid: Optional[int] = None,
                         branch_name: Optional[str] = None,
@@ -319,32 +684,28 @@ def merge_merge_request(project_id: Optional[Union[int, str]] = None,
                         sha: Optional[str] = None) -> Dict[str, Any]:
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
-    mr = _resolve_mr(project, merge_request_iid, branch_name)
+    project = _proj(pid)
+    mr = _resolve_mr(project, merge_request_iid, branch_name, lazy=True)
 
+    # merge() ya actualiza los atributos del MR con la respuesta del PUT
     mr.merge(when_pipeline_succeeds=merge_when_pipeline_succeeds, squash=squash, sha=sha)
-    mr = project.mergerequests.get(mr.iid)
-    return {"iid": mr.iid, "state": mr.state, "merged_at": getattr(mr, "merged_at", None)}
+    return {"iid": mr.iid, "state": getattr(mr, "state", "merged"), "merged_at": getattr(mr, "merged_at", None)}
 
-@mcp.tool()
 def get_merge_request_diffs(project_id: Optional[Union[int, str]] = None,
                             merge_request_iid: Optional[int] = None,
                             branch_name: Optional[str] = None,
                             page: int = 1, per_page: int = 20) -> List[Dict[str, Any]]:
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
-    mr = _resolve_mr(project, merge_request_iid, branch_name)
-    diffs = mr.changes()['changes']  # lista de archivos con diffs
-    # paginar manualmente
-    start = (page - 1) * per_page
-    end = start + per_page
-    return diffs[start:end]
+    project = _proj(pid)
+    mr = _resolve_mr(project, merge_request_iid, branch_name, lazy=True)
+    # /diffs pagina en el servidor: solo viaja la página pedida
+    return gl().http_list(f"{mr.manager.path}/{mr.encoded_id}/diffs",
+                        page=page, per_page=per_page, iterator=False)
 
-@mcp.tool()
 def get_branch_diffs(project_id: Optional[Union[int, str]] = None,
                      from_ref: str = "main", to_ref: str = "HEAD") -> Dict[str, Any]:
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
+    project = _proj(pid)
     comp = project.repository_compare(from_ref, to_ref)
     return comp
 
@@ -352,54 +713,53 @@ def get_branch_diffs(project_id: Optional[Union[int, str]] = None,
 # NOTES & DISCUSSIONS (Issues/MR)
 # ----------
 
-@mcp.tool()
 def create_note(project_id: Optional[Union[int, str]] = None, iid: int = 0,
                 on: str = "merge_request", body: str = "") -> Dict[str, Any]:
     """Crear comentario en issue o MR. `on`: 'merge_request'|'issue'"""
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
+    project = _proj(pid)
     if on == "issue":
-        tgt = project.issues.get(iid)
+        tgt = project.issues.get(iid, lazy=True)
     else:
-        tgt = project.mergerequests.get(iid)
+        tgt = project.mergerequests.get(iid, lazy=True)
     note = tgt.notes.create({"body": body})
     return {"id": note.id, "body": note.body}
 
-@mcp.tool()
-def mr_discussions(project_id: Optional[Union[int, str]] = None, merge_request_iid: int = 0) -> List[Dict[str, Any]]:
+def mr_discussions(project_id: Optional[Union[int, str]] = None, merge_request_iid: int = 0,
+                   limit: Optional[int] = None) -> List[Dict[str, Any]]:
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
-    mr = project.mergerequests.get(merge_request_iid)
-    discs = mr.discussions.list(get_all=True)
-    out: List[Dict[str, Any]] = []
-    for d in discs:
-        out.append({
+    project = _proj(pid)
+    mr = project.mergerequests.get(merge_request_iid, lazy=True)
+    # Generador paginado: se deja de pedir páginas al llegar a `limit`
+    discs = islice(mr.discussions.list(iterator=True, per_page=100), limit)
+    # Las notas vienen como dicts crudos dentro de cada discusión
+    return [
+        {
             "id": d.id,
             "notes": [
-                {"id": n.id, "author": getattr(n, "author", {}), "body": getattr(n, "body", ""), "system": getattr(n, "system", False)}
+                {"id": n.get("id"), "author": n.get("author", {}), "body": n.get("body", ""), "system": n.get("system", False)}
                 for n in d.attributes.get("notes", [])
             ],
-        })
-    return out
+        }
+        for d in discs
+    ]
 
-@mcp.tool()
 def create_merge_request_note(project_id: Optional[Union[int, str]] = None,
                               merge_request_iid: int = 0, body: str = "") -> Dict[str, Any]:
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
-    mr = project.mergerequests.get(merge_request_iid)
+    project = _proj(pid)
+    mr = project.mergerequests.get(merge_request_iid, lazy=True)
     note = mr.notes.create({"body": body})
     return {"id": note.id, "body": note.body}
 
-@mcp.tool()
 def update_merge_request_note(project_id: Optional[Union[int, str]] = None,
                               merge_request_iid: int = 0, note_id: int = 0, body: str = "") -> Dict[str, Any]:
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
-    mr = project.mergerequests.get(merge_request_iid)
+    project = _proj(pid)
+    mr = project.mergerequests.get(merge_request_iid, lazy=True)
     note = mr.notes.get(note_id)
     note.body = body
     note.save()
@@ -407,68 +767,62 @@ def update_merge_request_note(project_id: Optional[Union[int, str]] = None,
 
 # Draft Notes
 
-@mcp.tool()
-def list_draft_notes(project_id: Optional[Union[int, str]] = None, merge_request_iid: int = 0) -> List[Dict[str, Any]]:
+def list_draft_notes(project_id: Optional[Union[int, str]] = None, merge_request_iid: int = 0,
+                     limit: Optional[int] = None) -> List[Dict[str, Any]]:
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
-    mr = project.mergerequests.get(merge_request_iid)
-    drafts = mr.draft_notes.list(get_all=True)
+    project = _proj(pid)
+    mr = project.mergerequests.get(merge_request_iid, lazy=True)
+    drafts = islice(mr.draft_notes.list(iterator=True, per_page=100), limit)
     return [{"id": d.id, "note": d.note, "resolved": getattr(d, "resolved", False)} for d in drafts]
 
-@mcp.tool()
 def get_draft_note(project_id: Optional[Union[int, str]] = None, merge_request_iid: int = 0, draft_id: int = 0) -> Dict[str, Any]:
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
-    mr = project.mergerequests.get(merge_request_iid)
+    project = _proj(pid)
+    mr = project.mergerequests.get(merge_request_iid, lazy=True)
     d = mr.draft_notes.get(draft_id)
     return {"id": d.id, "note": d.note}
 
-@mcp.tool()
 def create_draft_note(project_id: Optional[Union[int, str]] = None, merge_request_iid: int = 0, note: str = "") -> Dict[str, Any]:
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
-    mr = project.mergerequests.get(merge_request_iid)
+    project = _proj(pid)
+    mr = project.mergerequests.get(merge_request_iid, lazy=True)
     d = mr.draft_notes.create({"note": note})
     return {"id": d.id, "note": d.note}
 
-@mcp.tool()
 def update_draft_note(project_id: Optional[Union[int, str]] = None, merge_request_iid: int = 0, draft_id: int = 0, note: str = "") -> Dict[str, Any]:
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
-    mr = project.mergerequests.get(merge_request_iid)
+    project = _proj(pid)
+    mr = project.mergerequests.get(merge_request_iid, lazy=True)
     d = mr.draft_notes.get(draft_id)
     d.note = note
     d.save()
     return {"id": d.id, "note": d.note}
 
-@mcp.tool()
 def delete_draft_note(project_id: Optional[Union[int, str]] = None, merge_request_iid: int = 0, draft_id: int = 0) -> Dict[str, Any]:
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
-    mr = project.mergerequests.get(merge_request_iid)
-    d = mr.draft_notes.get(draft_id)
+    project = _proj(pid)
+    mr = project.mergerequests.get(merge_request_iid, lazy=True)
+    d = mr.draft_notes.get(draft_id, lazy=True)
     d.delete()
     return {"deleted": True}
 
-@mcp.tool()
 def publish_draft_note(project_id: Optional[Union[int, str]] = None, merge_request_iid: int = 0, draft_id: int = 0) -> Dict[str, Any]:
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
-    mr = project.mergerequests.get(merge_request_iid)
-    d = mr.draft_notes.get(draft_id)
+    project = _proj(pid)
+    mr = project.mergerequests.get(merge_request_iid, lazy=True)
+    d = mr.draft_notes.get(draft_id, lazy=True)
     d.publish()
     return {"published": True}
 
-@mcp.tool()
 def bulk_publish_draft_notes(project_id: Optional[Union[int, str]] = None, merge_request_iid: int = 0) -> Dict[str, Any]:
     _assert_can_write()
     pid = _ensure_pid(project_id)
-    project = gl.projects.get(pid)
-    mr = project.mergerequests.get(merge_request_iid)
+    project = _proj(pid)
+    mr = project.mergerequests.get(merge_request_iid, lazy=True)
     mr.draft_notes.publish_all()
     return {"published_all": True}
 
@@ -476,209 +830,267 @@ def bulk_publish_draft_notes(project_id: Optional[Union[int, str]] = None, merge
 # PIPELINES (opcionales)
 # ----------
 
-if USE_PIPELINE:
-
-    @mcp.tool()
-    def list_pipelines(project_id: Optional[Union[int, str]] = None, ref: Optional[str] = None,
-                       status: Optional[str] = None, page: int = 1, per_page: int = 20) -> List[Dict[str, Any]]:
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        pls = project.pipelines.list(ref=ref, status=status, page=page, per_page=per_page)
-        return [{"id": p.id, "status": p.status, "sha": p.sha, "ref": p.ref, "web_url": p.web_url} for p in pls]
-
-    @mcp.tool()
-    def get_pipeline(project_id: Optional[Union[int, str]] = None, pipeline_id: int = 0) -> Dict[str, Any]:
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        p = project.pipelines.get(pipeline_id)
-        return p.attributes
-
-    @mcp.tool()
-    def list_pipeline_jobs(project_id: Optional[Union[int, str]] = None, pipeline_id: int = 0) -> List[Dict[str, Any]]:
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        p = project.pipelines.get(pipeline_id)
-        jobs = p.jobs.list(get_all=True)
-        return [{"id": j.id, "name": j.name, "status": j.status, "stage": j.stage} for j in jobs]
-
-    @mcp.tool()
-    def get_pipeline_job(project_id: Optional[Union[int, str]] = None, job_id: int = 0) -> Dict[str, Any]:
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        job = project.jobs.get(job_id)
-        return job.attributes
-
-    @mcp.tool()
-    def get_pipeline_job_output(project_id: Optional[Union[int, str]] = None, job_id: int = 0) -> Dict[str, Any]:
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        job = project.jobs.get(job_id)
-        # Log de job (trace)
-        trace = job.trace()
-        return {"id": job.id, "trace": trace}
-
-    @mcp.tool()
-    def create_pipeline(project_id: Optional[Union[int, str]] = None, ref: str = "main",
-                        variables: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
-        _assert_can_write()
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        payload: Dict[str, Any] = {"ref": ref}
-        if variables:
-            payload["variables"] = [{"key": k, "value": v} for k, v in variables.items()]
-        p = project.pipelines.create(payload)
-        return {"id": p.id, "status": p.status, "web_url": p.web_url}
-
-    @mcp.tool()
-    def retry_pipeline(project_id: Optional[Union[int, str]] = None, pipeline_id: int = 0) -> Dict[str, Any]:
-        _assert_can_write()
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        p = project.pipelines.get(pipeline_id)
-        p.retry()
-        return {"id": p.id, "status": p.status}
-
-    @mcp.tool()
-    def cancel_pipeline(project_id: Optional[Union[int, str]] = None, pipeline_id: int = 0) -> Dict[str, Any]:
-        _assert_can_write()
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        p = project.pipelines.get(pipeline_id)
-        p.cancel()
-        return {"id": p.id, "status": p.status}
+_TRACE_CHUNK = 64 * 1024
+_TRACE_DRAIN_CHUNKS = 4
+
+def list_pipelines(project_id: Optional[Union[int, str]] = None, ref: Optional[str] = None,
+                   status: Optional[str] = None, page: int = 1, per_page: int = 20) -> List[Dict[str, Any]]:
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    pls = gl().http_list(project.pipelines.path, query_data={"ref": ref, "status": status},
+                       page=page, per_page=per_page, iterator=False)
+    return [{"id": p["id"], "status": p["status"], "sha": p["sha"], "ref": p["ref"], "web_url": p["web_url"]}
+            for p in pls]
+
+def get_pipeline(project_id: Optional[Union[int, str]] = None, pipeline_id: int = 0) -> Dict[str, Any]:
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    p = project.pipelines.get(pipeline_id)
+    return p.attributes
+
+def list_pipeline_jobs(project_id: Optional[Union[int, str]] = None, pipeline_id: int = 0,
+                       limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    p = project.pipelines.get(pipeline_id, lazy=True)
+    jobs = islice(p.jobs.list(iterator=True, per_page=100), limit)
+    return [{"id": j.id, "name": j.name, "status": j.status, "stage": j.stage} for j in jobs]
+
+def get_pipeline_job(project_id: Optional[Union[int, str]] = None, job_id: int = 0) -> Dict[str, Any]:
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    job = project.jobs.get(job_id)
+    return job.attributes
+
+def get_pipeline_job_output(project_id: Optional[Union[int, str]] = None, job_id: int = 0,
+                            tail_bytes: Optional[int] = None,
+                            max_bytes: int = 1_000_000) -> Dict[str, Any]:
+    """Log (trace) de un job. `tail_bytes` devuelve solo el final; `max_bytes` acota el total."""
+    if (tail_bytes is not None and tail_bytes < 0) or max_bytes < 0:
+        raise ValueError("'tail_bytes' y 'max_bytes' no pueden ser negativos.")
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    job = project.jobs.get(job_id, lazy=True)
+    limit = min(tail_bytes, max_bytes) if tail_bytes else max_bytes
+    tail = bool(tail_bytes) and limit > 0
+
+    # Log de job (trace) en streaming: memoria acotada a `limit`. Se pide la respuesta
+    # cruda para poder cerrarla si se corta antes del final.
+    response = gl().http_get(f"{job.manager.path}/{job.encoded_id}/trace", streamed=True, raw=True)
+    stream = response.iter_content(chunk_size=_TRACE_CHUNK)
+    chunks: Deque[bytes] = deque()
+    size = total = 0
+    try:
+        for chunk in stream:
+            chunks.append(chunk)
+            size += len(chunk)
+            total += len(chunk)
+            if tail:
+                while size - len(chunks[0]) >= limit:
+                    size -= len(chunks.popleft())
+            elif size > limit:
+                # Si lo que falta es corto se lee y descarta: así la conexión vuelve al
+                # pool keep-alive en vez de cerrarse con datos pendientes.
+                for _ in islice(stream, _TRACE_DRAIN_CHUNKS):
+                    pass
+                break
+    finally:
+        response.close()
+    data = b"".join(chunks)
+    data = data[-limit:] if tail else data[:limit]
+    return {"id": job.id, "trace": data.decode("utf-8", errors="replace"),
+            "truncated": total > limit}
+
+def create_pipeline(project_id: Optional[Union[int, str]] = None, ref: str = "main",
+                    variables: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    _assert_can_write()
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    payload: Dict[str, Any] = {"ref": ref}
+    if variables:
+        payload["variables"] = [{"key": k, "value": v} for k, v in variables.items()]
+    p = project.pipelines.create(payload)
+    return {"id": p.id, "status": p.status, "web_url": p.web_url}
+
+def retry_pipeline(project_id: Optional[Union[int, str]] = None, pipeline_id: int = 0) -> Dict[str, Any]:
+    _assert_can_write()
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    # Sin GET previo: la respuesta de la acción ya trae el pipeline actualizado
+    res = project.pipelines.get(pipeline_id, lazy=True).retry()
+    return {"id": res["id"], "status": res["status"]}
+
+def cancel_pipeline(project_id: Optional[Union[int, str]] = None, pipeline_id: int = 0) -> Dict[str, Any]:
+    _assert_can_write()
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    # Sin GET previo: la respuesta de la acción ya trae el pipeline actualizado
+    res = project.pipelines.get(pipeline_id, lazy=True).cancel()
+    return {"id": res["id"], "status": res["status"]}
 
 # ----------
 # WIKI (opcional)
 # ----------
 
-if USE_WIKI:
-
-    @mcp.tool()
-    def list_wiki_pages(project_id: Optional[Union[int, str]] = None, with_content: bool = False) -> List[Dict[str, Any]]:
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        pages = project.wikis.list(get_all=True)
-        out = []
-        for p in pages:
-            d = {"slug": p.slug, "title": p.title}
-            if with_content:
-                page = project.wikis.get(p.slug)
-                d["content"] = page.content
-            out.append(d)
-        return out
-
-    @mcp.tool()
-    def get_wiki_page(project_id: Optional[Union[int, str]] = None, slug: str = "") -> Dict[str, Any]:
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        page = project.wikis.get(slug)
-        return {"slug": page.slug, "title": page.title, "content": page.content}
-
-    @mcp.tool()
-    def create_wiki_page(project_id: Optional[Union[int, str]] = None, title: str = "",
-                         content: str = "", format: str = "markdown") -> Dict[str, Any]:
-        _assert_can_write()
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        page = project.wikis.create({"title": title, "content": content, "format": format})
-        return {"slug": page.slug, "title": page.title}
-
-    @mcp.tool()
-    def update_wiki_page(project_id: Optional[Union[int, str]] = None, slug: str = "",
-                         content: Optional[str] = None, title: Optional[str] = None,
-                         format: Optional[str] = None) -> Dict[str, Any]:
-        _assert_can_write()
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        page = project.wikis.get(slug)
-        if content is not None:
-            page.content = content
-        if title is not None:
-            page.title = title
-        if format is not None:
-            page.format = format
-        page.save()
-        return {"slug": page.slug, "title": page.title}
-
-    @mcp.tool()
-    def delete_wiki_page(project_id: Optional[Union[int, str]] = None, slug: str = "") -> Dict[str, Any]:
-        _assert_can_write()
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        page = project.wikis.get(slug)
-        page.delete()
-        return {"deleted": True}
+def list_wiki_pages(project_id: Optional[Union[int, str]] = None, with_content: bool = False,
+                    limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    # `with_content` trae el contenido en el mismo listado (sin un GET por página)
+    pages = islice(project.wikis.list(iterator=True, with_content=int(with_content)), limit)
+    out = []
+    for p in pages:
+        d = {"slug": p.slug, "title": p.title}
+        if with_content:
+            d["content"] = getattr(p, "content", None)
+        out.append(d)
+    return out
+
+def get_wiki_page(project_id: Optional[Union[int, str]] = None, slug: str = "") -> Dict[str, Any]:
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    page = project.wikis.get(slug)
+    return {"slug": page.slug, "title": page.title, "content": page.content}
+
+def create_wiki_page(project_id: Optional[Union[int, str]] = None, title: str = "",
+                     content: str = "", format: str = "markdown") -> Dict[str, Any]:
+    _assert_can_write()
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    page = project.wikis.create({"title": title, "content": content, "format": format})
+    return {"slug": page.slug, "title": page.title}
+
+def update_wiki_page(project_id: Optional[Union[int, str]] = None, slug: str = "",
+                     content: Optional[str] = None, title: Optional[str] = None,
+                     format: Optional[str] = None) -> Dict[str, Any]:
+    _assert_can_write()
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    page = project.wikis.get(slug)
+    if content is not None:
+        page.content = content
+    if title is not None:
+        page.title = title
+    if format is not None:
+        page.format = format
+    page.save()
+    return {"slug": page.slug, "title": page.title}
+
+def delete_wiki_page(project_id: Optional[Union[int, str]] = None, slug: str = "") -> Dict[str, Any]:
+    _assert_can_write()
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    page = project.wikis.get(slug)
+    page.delete()
+    return {"deleted": True}
 
 # ----------
 # MILESTONES (opcional)
 # ----------
 
-if USE_MILESTONE:
-
-    @mcp.tool()
-    def list_milestones(project_id: Optional[Union[int, str]] = None, state: Optional[str] = None) -> List[Dict[str, Any]]:
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        mss = project.milestones.list(state=state, get_all=True)
-        return [{"id": m.id, "title": m.title, "state": m.state, "iid": getattr(m, "iid", None)} for m in mss]
-
-    @mcp.tool()
-    def get_milestone(project_id: Optional[Union[int, str]] = None, milestone_id: int = 0) -> Dict[str, Any]:
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        m = project.milestones.get(milestone_id)
-        return m.attributes
-
-    @mcp.tool()
-    def create_milestone(project_id: Optional[Union[int, str]] = None, title: str = "",
-                         description: Optional[str] = None, due_date: Optional[str] = None,
-                         start_date: Optional[str] = None) -> Dict[str, Any]:
-        _assert_can_write()
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        payload: Dict[str, Any] = {"title": title}
-        if description:
-            payload["description"] = description
-        if due_date:
-            payload["due_date"] = due_date
-        if start_date:
-            payload["start_date"] = start_date
-        m = project.milestones.create(payload)
-        return {"id": m.id, "title": m.title}
-
-    @mcp.tool()
-    def edit_milestone(project_id: Optional[Union[int, str]] = None, milestone_id: int = 0,
-                       title: Optional[str] = None, description: Optional[str] = None,
-                       due_date: Optional[str] = None, start_date: Optional[str] = None,
-                       state_event: Optional[str] = None) -> Dict[str, Any]:
-        _assert_can_write()
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        m = project.milestones.get(milestone_id)
-        if title is not None:
-            m.title = title
-        if description is not None:
-            m.description = description
-        if due_date is not None:
-            m.due_date = due_date
-        if start_date is not None:
-            m.start_date = start_date
-        if state_event is not None:
-            m.state_event = state_event  # "close" | "activate"
-        m.save()
-        return {"id": m.id, "title": m.title, "state": m.state}
-
-    @mcp.tool()
-    def delete_milestone(project_id: Optional[Union[int, str]] = None, milestone_id: int = 0) -> Dict[str, Any]:
-        _assert_can_write()
-        pid = _ensure_pid(project_id)
-        project = gl.projects.get(pid)
-        m = project.milestones.get(milestone_id)
-        m.delete()
-        return {"deleted": True}
+def list_milestones(project_id: Optional[Union[int, str]] = None, state: Optional[str] = None,
+                    limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    mss = islice(project.milestones.list(state=state, iterator=True, per_page=100), limit)
+    return [{"id": m.id, "title": m.title, "state": m.state, "iid": getattr(m, "iid", None)} for m in mss]
+
+def get_milestone(project_id: Optional[Union[int, str]] = None, milestone_id: int = 0) -> Dict[str, Any]:
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    m = project.milestones.get(milestone_id)
+    return m.attributes
+
+def create_milestone(project_id: Optional[Union[int, str]] = None, title: str = "",
+                     description: Optional[str] = None, due_date: Optional[str] = None,
+                     start_date: Optional[str] = None) -> Dict[str, Any]:
+    _assert_can_write()
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    payload: Dict[str, Any] = {"title": title}
+    if description:
+        payload["description"] = description
+    if due_date:
+        payload["due_date"] = due_date
+    if start_date:
+        payload["start_date"] = start_date
+    m = project.milestones.create(payload)
+    return {"id": m.id, "title": m.title}
+
+def edit_milestone(project_id: Optional[Union[int, str]] = None, milestone_id: int = 0,
+                   title: Optional[str] = None, description: Optional[str] = None,
+                   due_date: Optional[str] = None, start_date: Optional[str] = None,
+                   state_event: Optional[str] = None) -> Dict[str, Any]:
+    _assert_can_write()
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    m = project.milestones.get(milestone_id)
+    if title is not None:
+        m.title = title
+    if description is not None:
+        m.description = description
+    if due_date is not None:
+        m.due_date = due_date
+    if start_date is not None:
+        m.start_date = start_date
+    if state_event is not None:
+        m.state_event = state_event  # "close" | "activate"
+    m.save()
+    return {"id": m.id, "title": m.title, "state": m.state}
+
+def delete_milestone(project_id: Optional[Union[int, str]] = None, milestone_id: int = 0) -> Dict[str, Any]:
+    _assert_can_write()
+    pid = _ensure_pid(project_id)
+    project = _proj(pid)
+    m = project.milestones.get(milestone_id)
+    m.delete()
+    return {"deleted": True}
+
+# -----------------------------
+# Registro de tools
+# -----------------------------
+# Los grupos deshabilitados no se registran: FastMCP no genera su schema.
+_TOOLS: List[Tuple[bool, Tuple[Callable[..., Any], ...]]] = [
+    (True, (
+        search_repositories, create_repository, get_file_contents, create_or_update_file,
+        push_files, begin_batch, commit_batch, fork_repository, create_branch, create_issue,
+        list_issues, create_merge_request, get_merge_request, update_merge_request,
+        merge_merge_request, get_merge_request_diffs, get_branch_diffs, create_note,
+        mr_discussions, create_merge_request_note, update_merge_request_note, list_draft_notes,
+        get_draft_note, create_draft_note, update_draft_note, delete_draft_note,
+        publish_draft_note, bulk_publish_draft_notes,
+    )),
+    (USE_PIPELINE, (
+        list_pipelines, get_pipeline, list_pipeline_jobs, get_pipeline_job,
+        get_pipeline_job_output, create_pipeline, retry_pipeline, cancel_pipeline,
+    )),
+    (USE_WIKI, (
+        list_wiki_pages, get_wiki_page, create_wiki_page, update_wiki_page, delete_wiki_page,
+    )),
+    (USE_MILESTONE, (
+        list_milestones, get_milestone, create_milestone, edit_milestone, delete_milestone,
+    )),
+]
+for _enabled, _fns in _TOOLS:
+    if _enabled:
+        for _fn in _fns:
+            _register(_fn)
 
 # -----------------------------
 # main
 # -----------------------------
 if __name__ == "__main__":
-    mcp.run(transport=TRANSPORT)
+    if TRANSPORT != "stdio":
+        # Loop uvloop (opcional, solo POSIX) para los transportes HTTP; si no está
+        # instalado se queda el loop por defecto de asyncio.
+        try:
+            import uvloop
+            uvloop.install()
+        except ImportError:
+            pass
+    try:
+        mcp.run(transport=TRANSPORT)
+    finally:
+        # Cierra el pool de conexiones keep-alive hacia GitLab
+        if _gl is not None:
+            _gl.session.close()